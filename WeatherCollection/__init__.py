@@ -1,54 +1,153 @@
+from datetime import datetime, time, timedelta
+import json
 import logging
 import os
+from typing import Iterable
 from urllib.parse import urljoin
 
 from mysql.connector import MySQLConnection
+import numpy as np
+import orjson
 import pandas as pd
 import requests as r
 
+from shared_code.coverage import CoverageIndex, nonexistent_hours
 from shared_code.database import getConnection
+from shared_code.profiling import write_profile_report
+from shared_code.rollups import DailyRollups
+from shared_code.scheduler import schedule
+from shared_code.weathercache import WeatherCache
 
-select_dates_sql = """
+select_range_sql = """
 SELECT
-  SiteID,
-  PointID,
-  TIMESTAMP(date_value) AS 'ts'
-FROM
-  dim_date
-LEFT JOIN
-  tr ON (
-    tr.datevalue = dim_date.date_value
-    AND SiteID = 140
-    AND PointID = %s
-  )
-WHERE
-  dim_date.date_value >= DATE_SUB(NOW(), INTERVAL %s YEAR)
-  AND dim_date.date_value < DATE(DATE_SUB(NOW(), INTERVAL 1 DAY))
-  AND tr.datevalue IS NULL
+  DATE(DATE_SUB(NOW(), INTERVAL %s YEAR)),
+  DATE(DATE_SUB(NOW(), INTERVAL 1 DAY))
 """
 
 
-def get_missing_dates(conn: MySQLConnection, pointid: int) -> pd.DataFrame:
+def get_missing_dates(
+    conn: MySQLConnection,
+    pointid: int,
+    coverage: CoverageIndex
+) -> pd.DataFrame:
     lb_years = 0.5
 
     with conn.cursor() as cur:
-        cur.execute(select_dates_sql, (pointid, lb_years))
+        cur.execute(select_range_sql, (lb_years,))
 
-        dates_result = cur.fetchall()
+        start, end = cur.fetchone()
 
-        df_dates = pd.DataFrame(
-            dates_result,
-            columns=['SiteID', 'PointID', 'ts']
-        )
+    # any day without all 24 hours stored needs to be collected again
+    coverage.load(pointid, start, end)
+    missing_days = coverage.missing_days(pointid, start, end)
+
+    df_dates = pd.DataFrame(
+        [(140, pointid, datetime.combine(x, time())) for x in missing_days],
+        columns=['SiteID', 'PointID', 'ts']
+    )
 
     return df_dates
 
 
+def get_date_ranges(dates: list, max_days: int) -> list:
+    """Groups dates into contiguous (start, end) ranges of no more than
+    `max_days` days each.
+
+    :param dates: Dates to group
+    :type dates: list
+    :param max_days: Longest range to create
+    :type max_days: int
+    :return: List of (start, end) tuples, end inclusive
+    :rtype: list
+    """
+
+    ranges = []
+
+    for current in sorted(dates):
+        if (
+            len(ranges) > 0
+            and current - ranges[-1][1] == timedelta(days=1)
+            and current - ranges[-1][0] < timedelta(days=max_days)
+        ):
+            ranges[-1] = (ranges[-1][0], current)
+        else:
+            ranges.append((current, current))
+
+    return ranges
+
+
+def decode_response(
+    content: bytes,
+    elements: Iterable[str],
+    include: str = "hours"
+) -> tuple:
+    """Decodes a timeline api response into arrays without going through a
+    record per row.
+
+    :param content: Raw response body
+    :type content: bytes
+    :param elements: Elements to read for each row
+    :type elements: Iterable[str]
+    :param include: Resolution that was requested, either "hours" or "days",
+    defaults to "hours"
+    :type include: str, optional
+    :return: The response timezone, utc epoch seconds and a float array per
+    element with missing values as NaN
+    :rtype: tuple
+    """
+
+    json_response = orjson.loads(content)
+
+    # range requests hold a day entry per requested date
+    if include == "days":
+        hours = json_response['days']
+    else:
+        hours = [
+            hour
+            for day in json_response['days']
+            for hour in day.get('hours', [])
+        ]
+    count = len(hours)
+
+    epochs = np.fromiter(
+        (hour['datetimeEpoch'] for hour in hours), dtype=np.int64, count=count
+    )
+
+    values = {}
+    for key in elements:
+        values[key] = np.fromiter(
+            (
+                np.nan if hour.get(key) is None else hour[key]
+                for hour in hours
+            ),
+            dtype=np.float64,
+            count=count
+        )
+
+    return json_response['timezone'], epochs, values
+
+
 def main(params: tuple):
     error = False
 
     # no more than 1000 calls per run
-    cur_calls = 0
+    call_budget = int(os.environ.get("WC_CALL_BUDGET", 1000))
+
+    # resolution to collect at, "hours" or "days", for the run and for
+    #     individual stations
+    default_resolution = os.environ.get("WC_RESOLUTION", "hours")
+    station_resolutions = {
+        int(x): y for x, y in
+        json.loads(os.environ.get("WC_STATION_RESOLUTION", "{}")).items()
+    }
+
+    # longest date range requested in a single daily call
+    max_range_days = 31
+
+    # days this recent are always collected hourly, even for stations at
+    #     daily resolution, so the hourly points, the alias points and
+    #     regressions built from them keep getting the latest data
+    hourly_days = 7
 
     # api key for visual crossing requests
     vc_api_key = os.environ.get("VC_API_KEY")
@@ -60,7 +159,17 @@ def main(params: tuple):
     # EDGAR database connection
     db = getConnection()
 
-    select_stations_sql = """SELECT ID,Latitude,Longitude,Link,PointID
+    # hours of data stored for each weather point
+    coverage = CoverageIndex(db)
+
+    # daily aggregates of each weather point
+    rollups = DailyRollups(db)
+
+    # optional local read cache for regression consumers
+    cache_dir = os.environ.get("WEATHER_CACHE_DIR")
+    cache = WeatherCache(cache_dir) if cache_dir else None
+
+    select_stations_sql = """SELECT ID,Latitude,Longitude,Link,PointID,LastRun
     FROM regressionweatherstations
     WHERE Enabled = 1"""
 
@@ -85,6 +194,10 @@ def main(params: tuple):
 
         df_stations = list(cur.fetchall())
 
+    # reuse connections across requests, requests already asks for gzip
+    #     compressed responses by default
+    session = r.Session()
+
     # all the weather points are held in site 140
     siteid = 140
 
@@ -108,7 +221,18 @@ def main(params: tuple):
     apiParameters = list(characteristics.keys())
     apiParameters.append('datetimeEpoch')
 
-    # iterate through each of the stations and fill any required data
+    # daily minimums and maximums the api provides for a day, keyed by
+    #     characteristic
+    daily_extremes = {
+        key: (key + 'min', key + 'max') for key in ('temp', 'feelslike')
+    }
+    daily_elements = list(characteristics.keys()) +\
+        [x for y in daily_extremes.values() for x in y]
+
+    # outstanding work for each station
+    work = {}
+
+    # iterate through each of the stations and find any required data
     for station in df_stations:
 
         logging.info(station[3])
@@ -141,40 +265,125 @@ def main(params: tuple):
 
             point_ids[key]['ID'] = point_result[0]
             point_ids[key]['Values'] = []
+            point_ids[key]['Daily'] = []
 
             logging.info(f"Found point {point_result[0]} for {point_name}.")
 
-        # dates that need to get data for current point
-        df_dates = get_missing_dates(db, station[4])
+        # degree days are calculated from the station point rollups
+        rollups.ensure(station[4])
 
-        # base url to make the requests to
-        base_url = "https://weather.visualcrossing.com/"\
-            "VisualCrossingWebServices/rest/services/timeline/"
+        # dates that need to get data for current point
+        df_dates = get_missing_dates(db, station[4], coverage)
 
         if len(df_dates) == 0:
             logging.info(f"No new data needed for {station[3]}")
             continue
 
-        for _, missing in df_dates.iterrows():
-            logging.info(missing['ts'])
+        resolution = station_resolutions.get(station[0], default_resolution)
+
+        if resolution not in ("hours", "days"):
+            raise ValueError(f"Unknown resolution '{resolution}'.")
+
+        dates = [x.to_pydatetime() for x in df_dates['ts']]
+        if resolution == "days":
+            recent = datetime.combine(
+                datetime.now().date() - timedelta(days=hourly_days), time()
+            )
+            hourly_dates = [x for x in dates if x >= recent]
+            daily_dates = [x for x in dates if x < recent]
+        else:
+            hourly_dates, daily_dates = dates, []
+
+        if len(daily_dates) > 0:
+            # days with a daily rollup of the station point are complete at
+            #     daily resolution, they're only collected again hourly
+            rolled_up = rollups.rolled_up_days(
+                station[4], min(daily_dates).date(), max(daily_dates).date()
+            )
+            daily_dates = [
+                x for x in daily_dates if x.date() not in rolled_up
+            ]
+
+        # (start, end, resolution) requests, daily collection requests
+        #     contiguous dates in a single call
+        requests = [(x, x, "hours") for x in hourly_dates] + [
+            (start, end, "days")
+            for start, end in get_date_ranges(daily_dates, max_range_days)
+        ]
+
+        if len(requests) == 0:
+            logging.info(f"No new data needed for {station[3]}")
+            continue
+
+        work[station[0]] = {
+            'Station': station,
+            'PointIDs': point_ids,
+            'Requests': requests
+        }
+
+    # fit the outstanding work to the call budget
+    plan, deferred = schedule(
+        {x: y['Requests'] for x, y in work.items()},
+        call_budget,
+        policy=os.environ.get("WC_SCHEDULE_POLICY", "recent"),
+        last_run={x: y['Station'][5] for x, y in work.items()},
+        weights={
+            int(x): y for x, y in
+            json.loads(os.environ.get("WC_STATION_WEIGHTS", "{}")).items()
+        }
+    )
+
+    logging.info(
+        f"Scheduled {sum(len(x) for _, x in plan)} requests, deferred "
+        f"{sum(deferred.values())}."
+    )
+
+    # base url to make the requests to
+    base_url = "https://weather.visualcrossing.com/"\
+        "VisualCrossingWebServices/rest/services/timeline/"
+
+    # fill the scheduled data for each station
+    for station_id, requests in plan:
+        if len(requests) == 0:
+            continue
+
+        station = work[station_id]['Station']
+        point_ids = work[station_id]['PointIDs']
+
+        logging.info(station[3])
+
+        # local hours collected for the station
+        collected_hours = []
+
+        # hours of the collected days that can't exist due to daylight
+        #     savings and should be counted as stored
+        skipped_hours = {}
+
+        for start_date, end_date, resolution in requests:
+            logging.info(f"{start_date} - {end_date} ({resolution})")
+
+            # single days are requested on their own, ranges as start/end
+            date_path = start_date.strftime("%Y-%m-%d")
+            if end_date != start_date:
+                date_path += "/" + end_date.strftime("%Y-%m-%d")
 
             # make the api request to get the required weather data
             params = {
                 "key": vc_api_key,
-                "include": "hours",
-                "elements": ','.join(apiParameters)
+                "include": resolution,
+                "elements": ','.join(
+                    apiParameters if resolution == "hours"
+                    else daily_elements + ['datetimeEpoch']
+                )
             }
-            response = r.get(
+            response = session.get(
                 urljoin(
                     base_url,
-                    f"{station[1]},{station[2]}/" +
-                    missing['ts'].strftime("%Y-%m-%d")
+                    f"{station[1]},{station[2]}/" + date_path
                 ),
-                params
+                params=params
             )
 
-            cur_calls += 1
-
             if response.status_code != 200:
                 logging.error(
                     f"API Returned: {response.status_code} - {response.text}"
@@ -183,34 +392,58 @@ def main(params: tuple):
                 error = True
                 break
 
-            # parse the json response data
-            json_response = response.json()
-            weather_data = json_response['days'][0]['hours']
-
-            # read the response into a dataframe
-            df = pd.DataFrame.from_records(weather_data)
-
-            # read the timezone
-            timezone = json_response['timezone']
-
-            # convert the seconds time into a datetime
-            df['datetimeEpoch'] = pd.to_datetime(df['datetimeEpoch'], unit='s')
-            # set the index as the time column
-            df = df.set_index(pd.DatetimeIndex(df['datetimeEpoch']))
+            # decode the response straight into arrays
+            timezone, epochs, values = decode_response(
+                response.content,
+                characteristics if resolution == "hours" else daily_elements,
+                resolution
+            )
 
-            # set the datetime index as utc relative and then convert to the
-            # local timezone
-            df = df.tz_localize(tz='UTC')\
+            # convert the utc seconds into local datetimes
+            index = pd.to_datetime(epochs, unit='s', utc=True)\
                 .tz_convert(tz=timezone)\
                 .tz_localize(tz=None)
 
             # remove duplicates due to daylight savings
-            df = df.loc[~df.index.duplicated(keep='first')]
+            keep = ~index.duplicated(keep='first')
+            index = index[keep]
+
+            timestamps = index.tolist()
+
+            # daily values only feed the rollups, the hourly points and their
+            #     coverage are left to the hourly requests
+            if resolution == "days":
+                unknown = np.full(len(timestamps), np.nan)
+
+                for key, value in point_ids.items():
+                    minimums, maximums = (
+                        values[x][keep] if x in values else unknown
+                        for x in daily_extremes.get(key, ('', ''))
+                    )
+
+                    point_ids[key]['Daily'] += list(
+                        zip(
+                            timestamps,
+                            values[key][keep].tolist(),
+                            minimums.tolist(),
+                            maximums.tolist()
+                        )
+                    )
+
+                continue
+
+            collected_hours += timestamps
+
+            day = start_date.date()
+            while day <= end_date.date():
+                skipped_hours[day] = nonexistent_hours(day, timezone)
+                day += timedelta(days=1)
 
             # build each of the series
             for key, value in point_ids.items():
-                point_ids[key]['Values'] +=\
-                    df[key].reset_index().values.tolist()
+                point_ids[key]['Values'] += list(
+                    zip(timestamps, values[key][keep].tolist())
+                )
 
         # insert the data into EDGAR
         for key, value in point_ids.items():
@@ -231,9 +464,33 @@ def main(params: tuple):
                 if len(params) > 0:
                     logging.info("Inserting data.")
                     cur.executemany(insert_trends_sql, params)
-                else:
+                elif len(value['Daily']) == 0:
                     logging.warning("No data to insert.")
 
+            rollups.add(
+                value['ID'], value['Values'], total=(key == 'precip')
+            )
+            rollups.add_daily(
+                value['ID'], value['Daily'], total=(key == 'precip')
+            )
+
+        # the station point drives degree days and the daily missing date
+        #     lookup, so it gets the daily temperature if it's a separate point
+        if station[4] not in {x['ID'] for x in point_ids.values()}:
+            rollups.add_daily(station[4], point_ids['temp']['Daily'])
+
+        # flag the collected hours as stored, the station point drives the
+        #     missing date lookup so it's tracked along with each
+        #     characteristic point
+        tracked_points = {value['ID'] for value in point_ids.values()}
+        tracked_points.add(station[4])
+
+        for point_id in tracked_points:
+            coverage.mark(point_id, collected_hours)
+
+            for day, mask in skipped_hours.items():
+                coverage.mark_hours(point_id, day, mask)
+
         # indicate that this station was looked at by updating the LastRun
         # column
         with db.cursor() as cur:
@@ -250,9 +507,24 @@ def main(params: tuple):
             )
 
         # commit after each station update
+        coverage.save()
+        rollups.save()
         db.commit()
 
-    # update degree days
+        # bring any cached archives in line with what was just committed, the
+        #     trends are already stored so a cache failure is only logged
+        if cache is not None:
+            for value in point_ids.values():
+                try:
+                    cache.update(value['ID'], value['Values'])
+                except OSError as e:
+                    logging.error(
+                        f"Unable to update weather cache for point "
+                        f"{value['ID']}: {e}"
+                    )
+
+    # update degree days from the daily rollups of the station points, days
+    #     collected daily have no trends so are only calculated once
     with db.cursor() as cur:
         # create a temporary table that contains the degree day calculations
         cur.execute(
@@ -262,23 +534,23 @@ def main(params: tuple):
             SELECT
               point.SiteID,
               regressionweatherdeppoints.PointID,
-              p1.DateValue,
+              weatherrollup.DateValue,
               '00:00:00' AS 'timevalue',
               IF (
                 point.PointClassID = 622,
                 IF (
-                    AVG(tr.NumericValue)
+                    AVG(weatherrollup.MeanValue)
                     -GET_NUMERIC(pointmetadata.MetadataValue) < 0,
                     0,
-                    AVG(tr.NumericValue)
+                    AVG(weatherrollup.MeanValue)
                     -GET_NUMERIC(pointmetadata.MetadataValue)
                 ),
                 IF(
                     GET_NUMERIC(pointmetadata.MetadataValue)
-                    -AVG(tr.NumericValue) < 0,
+                    -AVG(weatherrollup.MeanValue) < 0,
                     0,
                     GET_NUMERIC(pointmetadata.MetadataValue)
-                    -AVG(tr.NumericValue)
+                    -AVG(weatherrollup.MeanValue)
                 )
               ) AS 'NumericValue'
             FROM
@@ -288,16 +560,22 @@ def main(params: tuple):
                 regressionweatherdeppoints.WeatherStationID =
                 regressionweatherstations.ID
               )
+            JOIN
+              weatherrollup ON (
+                weatherrollup.PointID =
+                regressionweatherstations.PointID
+              )
             LEFT JOIN
               pointdaily p1 ON (
                 p1.PointID =
                 regressionweatherstations.PointID
+                AND p1.DateValue = weatherrollup.DateValue
               )
             LEFT JOIN
               pointdaily p2 ON (
                 p2.PointID =
                 regressionweatherdeppoints.PointID
-                AND p1.DateValue = p2.DateValue
+                AND weatherrollup.DateValue = p2.DateValue
               )
             JOIN
               point ON (
@@ -310,12 +588,6 @@ def main(params: tuple):
                 point.ID
                 AND pointmetadata.Metadata_id=624
               )
-            LEFT JOIN
-              tr ON (
-                tr.SiteID = 140 AND tr.PointID =
-                regressionweatherstations.PointID
-                AND tr.datevalue = p1.Datevalue
-              )
             WHERE
               regressionweatherstations.Enabled = 1
               AND (p2.NewRecords IS NULL OR p2.NewRecords < p1.NewRecords)
@@ -454,6 +726,9 @@ def main(params: tuple):
 
     db.commit()
 
+    # no-op unless statement profiling was enabled for the connection
+    write_profile_report(db)
+
     if error:
         raise Exception(
           "At least one error was encountered that may have resulted in missed"
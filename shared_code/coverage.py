@@ -0,0 +1,214 @@
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from mysql import connector
+
+# every hour of the day is stored
+FULL_DAY = (1 << 24) - 1
+
+create_coverage_sql = """
+CREATE TABLE IF NOT EXISTS weathercoverage (
+  PointID INT NOT NULL,
+  DateValue DATE NOT NULL,
+  HourMask INT UNSIGNED NOT NULL DEFAULT 0,
+  PRIMARY KEY (PointID, DateValue)
+)
+"""
+
+select_coverage_sql = """
+SELECT
+  DateValue,
+  HourMask
+FROM
+  weathercoverage
+WHERE
+  PointID = %s
+  AND DateValue >= %s
+  AND DateValue < %s
+"""
+
+select_indexed_sql = """
+SELECT 1 FROM weathercoverage WHERE PointID = %s LIMIT 1
+"""
+
+upsert_coverage_sql = """
+INSERT INTO weathercoverage
+(PointID, DateValue, HourMask)
+VALUES (%s, %s, %s)
+ON DUPLICATE KEY UPDATE
+  HourMask = HourMask | VALUES(HourMask)
+"""
+
+rebuild_coverage_sql = """
+INSERT INTO weathercoverage
+(PointID, DateValue, HourMask)
+SELECT
+  PointID,
+  datevalue,
+  BIT_OR(1 << HOUR(timevalue))
+FROM
+  tr
+WHERE
+  SiteID = 140
+  AND PointID = %s
+  AND datevalue >= %s
+GROUP BY
+  PointID, datevalue
+ON DUPLICATE KEY UPDATE
+  HourMask = HourMask | VALUES(HourMask)
+"""
+
+
+def nonexistent_hours(day: date, tz: str) -> int:
+    """Builds the hour mask of local hours that don't exist on the given day,
+    i.e. the hour skipped when daylight savings starts. These can never be
+    stored so are treated as covered.
+
+    :param day: Local date to check
+    :type day: date
+    :param tz: IANA timezone name as returned by the weather api
+    :type tz: str
+    :return: Mask with a bit set for each nonexistent hour
+    :rtype: int
+    """
+
+    zone = ZoneInfo(tz)
+    mask = 0
+
+    for hour in range(24):
+        local = datetime.combine(day, time(hour))
+        roundtrip = local.replace(tzinfo=zone)\
+            .astimezone(timezone.utc)\
+            .astimezone(zone)\
+            .replace(tzinfo=None)
+
+        if roundtrip != local:
+            mask |= 1 << hour
+
+    return mask
+
+
+class CoverageIndex:
+    """Per point bitmap of the local hours that have data stored in `tr`.
+    Each day is held as a 24 bit mask in the `weathercoverage` side table so
+    gaps can be found in memory without scanning `tr`. The table is created
+    when the index is, so create it once up front rather than mid-transaction.
+
+    :param conn: Database connection holding the side table
+    :type conn: connector.MySQLConnection
+    """
+
+    def __init__(self, conn: connector.MySQLConnection):
+        self.conn = conn
+        # point id -> date -> hour mask
+        self.masks = {}
+        # (point id, date) -> bits set since the last save
+        self.changes = {}
+
+        with conn.cursor() as cur:
+            cur.execute(create_coverage_sql)
+
+    def load(self, point_id: int, start: date, end: date):
+        """Reads the masks for [start, end) into memory. Points that have
+        never been indexed are first rebuilt from `tr`."""
+
+        masks = self.masks.setdefault(point_id, {})
+
+        with self.conn.cursor() as cur:
+            cur.execute(select_indexed_sql, (point_id,))
+
+            if cur.fetchone() is None:
+                self.rebuild(point_id, start)
+
+            cur.execute(select_coverage_sql, (point_id, start, end))
+
+            for day, mask in cur.fetchall():
+                masks[day] = masks.get(day, 0) | int(mask)
+
+    def rebuild(self, point_id: int, since: date):
+        """Indexes the hours already stored in `tr` for a point. Runs in the
+        caller's transaction, committing is left to the caller."""
+
+        logging.info(f"Rebuilding coverage for point {point_id}.")
+
+        with self.conn.cursor() as cur:
+            cur.execute(rebuild_coverage_sql, (point_id, since))
+
+    def mark_hours(self, point_id: int, day: date, mask: int):
+        masks = self.masks.setdefault(point_id, {})
+        masks[day] = masks.get(day, 0) | mask
+
+        key = (point_id, day)
+        self.changes[key] = self.changes.get(key, 0) | mask
+
+    def mark(self, point_id: int, timestamps):
+        """Flags the hour of each local timestamp as stored."""
+
+        for ts in timestamps:
+            self.mark_hours(point_id, ts.date(), 1 << ts.hour)
+
+    def save(self):
+        """Writes the bits set since the last save to the side table. Runs in
+        the caller's transaction so it commits alongside the trend data."""
+
+        if len(self.changes) == 0:
+            return
+
+        with self.conn.cursor() as cur:
+            cur.executemany(
+                upsert_coverage_sql,
+                [(p, d, m) for (p, d), m in self.changes.items()]
+            )
+
+        self.changes = {}
+
+    def gaps(self, point_id: int, start: date, end: date) -> list:
+        """Finds the missing hour ranges for [start, end) from the loaded
+        masks.
+
+        :return: List of (start, end) datetimes, end exclusive
+        :rtype: list
+        """
+
+        masks = self.masks.get(point_id, {})
+        gaps = []
+        gap_start = None
+
+        day = start
+        while day < end:
+            mask = masks.get(day, 0)
+
+            for hour in range(24):
+                stored = mask & (1 << hour)
+
+                if not stored and gap_start is None:
+                    gap_start = datetime.combine(day, time(hour))
+                elif stored and gap_start is not None:
+                    gaps.append(
+                        (gap_start, datetime.combine(day, time(hour)))
+                    )
+                    gap_start = None
+
+            day += timedelta(days=1)
+
+        if gap_start is not None:
+            gaps.append((gap_start, datetime.combine(end, time())))
+
+        return gaps
+
+    def missing_days(self, point_id: int, start: date, end: date) -> list:
+        """Lists the days in [start, end) that have at least one missing
+        hour."""
+
+        masks = self.masks.get(point_id, {})
+        days = []
+
+        day = start
+        while day < end:
+            if masks.get(day, 0) != FULL_DAY:
+                days.append(day)
+
+            day += timedelta(days=1)
+
+        return days
@@ -3,6 +3,8 @@ import os
 
 from mysql import connector
 
+from shared_code.profiling import profile_connection
+
 
 def getConnection() -> connector.MySQLConnection:
 
@@ -15,4 +17,9 @@ def getConnection() -> connector.MySQLConnection:
         db=os.environ['db_DATABASE']
     )
 
+    # opt-in statement profiling
+    if os.environ.get('db_PROFILE', '0') == '1':
+        logging.info("Profiling database statements.")
+        conn = profile_connection(conn)
+
     return conn
@@ -0,0 +1,322 @@
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+from datetime import datetime
+
+from mysql import connector
+from mysql.connector.errors import Error
+
+# statements that MySQL/MariaDB will accept behind an EXPLAIN
+explainable_re = re.compile(
+    r"^\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE
+)
+
+# CREATE TABLE ... SELECT can't be explained directly, but its SELECT can
+create_select_re = re.compile(
+    r"^\s*CREATE\s+(TEMPORARY\s+)?TABLE\s+\S+\s+(SELECT\b.*)$",
+    re.IGNORECASE | re.DOTALL
+)
+
+
+class StatementProfiler:
+    """Collects latency and row counts for every statement executed through a
+    `ProfiledConnection`. Statements slower than the threshold have their plan
+    captured with EXPLAIN (or EXPLAIN ANALYZE / MariaDB's ANALYZE for plain
+    SELECTs when enabled) for a sampled fraction of executions.
+
+    :param threshold_ms: Latency above which a statement is considered slow,
+    defaults to 1000
+    :type threshold_ms: float, optional
+    :param sample_rate: Fraction of slow statements to capture plans for,
+    defaults to 1.0
+    :type sample_rate: float, optional
+    :param analyze: Execute SELECT statements to capture their actual plan,
+    defaults to False
+    :type analyze: bool, optional
+    :param report_dir: Directory the per-run report is written to, defaults to
+    the system temp directory
+    :type report_dir: str, optional
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float = 1000,
+        sample_rate: float = 1.0,
+        analyze: bool = False,
+        report_dir: str = None
+    ):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.analyze = analyze
+        # the function app root is read-only when running from a package
+        self.report_dir = report_dir or tempfile.gettempdir()
+        self.started = datetime.now()
+        self.records = []
+        # server type, read from the first connection a plan is captured on
+        self.mariadb = None
+
+    def record(
+        self,
+        statement: str,
+        elapsed_ms: float,
+        rowcount: int,
+        many: bool = False
+    ) -> dict:
+        """Stores the timing for a single execution.
+
+        :return: The stored record, which is later annotated with its plan if
+        one is captured
+        :rtype: dict
+        """
+
+        record = {
+            "statement": " ".join(statement.split()),
+            "elapsed_ms": round(elapsed_ms, 3),
+            "rowcount": rowcount,
+            "executemany": many,
+            "slow": elapsed_ms >= self.threshold_ms
+        }
+        self.records.append(record)
+
+        if record["slow"]:
+            logging.warning(
+                f"Slow statement ({elapsed_ms:.0f} ms, {rowcount} rows): "
+                f"{record['statement'][:120]}"
+            )
+
+        return record
+
+    def wants_plan(self, record: dict) -> bool:
+        return record["slow"] and random.random() < self.sample_rate
+
+    def explain_sql(self, statement: str, mariadb: bool = False):
+        """Builds the EXPLAIN statement for the given SQL, or None if the
+        statement has no plan to capture."""
+
+        create_match = create_select_re.match(statement)
+        if create_match is not None:
+            return "EXPLAIN " + create_match.group(2)
+
+        if explainable_re.match(statement) is None:
+            return None
+
+        if self.analyze and statement.lstrip()[:6].upper() == "SELECT":
+            # ANALYZE executes the statement, so it is only safe for reads
+            if mariadb:
+                return "ANALYZE " + statement
+
+            return "EXPLAIN ANALYZE " + statement
+
+        return "EXPLAIN " + statement
+
+    def capture_plan(self, conn, record: dict, statement: str, params):
+        """Runs EXPLAIN for a slow statement on a separate cursor and stores
+        the plan rows against its record."""
+
+        try:
+            if self.mariadb is None:
+                self.mariadb = "MariaDB" in conn.get_server_info()
+
+            explain = self.explain_sql(statement, self.mariadb)
+            if explain is None:
+                return
+
+            with conn.cursor() as cur:
+                cur.execute(explain, params)
+                columns = [c[0] for c in cur.description or []]
+                record["plan"] = [
+                    dict(zip(columns, [str(v) for v in row]))
+                    for row in cur.fetchall()
+                ]
+        except Error as e:
+            record["plan_error"] = str(e)
+
+    def summary(self) -> list:
+        """Aggregates the records by statement text, slowest total first."""
+
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(
+                record["statement"],
+                {
+                    "statement": record["statement"],
+                    "executions": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0
+                }
+            )
+            total["executions"] += 1
+            total["total_ms"] += record["elapsed_ms"]
+            total["max_ms"] = max(total["max_ms"], record["elapsed_ms"])
+            total["rows"] += max(record["rowcount"], 0)
+
+        return sorted(
+            totals.values(), key=lambda x: x["total_ms"], reverse=True
+        )
+
+    def write_report(self) -> str:
+        """Writes the run's statement summary and slow statement plans as
+        JSON.
+
+        :return: Path of the written report
+        :rtype: str
+        """
+
+        os.makedirs(self.report_dir, exist_ok=True)
+        path = os.path.join(
+            self.report_dir,
+            f"sqlprofile-{self.started.strftime('%Y%m%dT%H%M%S')}.json"
+        )
+
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "started": self.started.isoformat(),
+                    "threshold_ms": self.threshold_ms,
+                    "statements": self.summary(),
+                    "slow": [x for x in self.records if x["slow"]]
+                },
+                f,
+                indent=2
+            )
+
+        logging.info(f"Wrote SQL profile report to {path}.")
+
+        return path
+
+
+class ProfiledCursor:
+    """Cursor wrapper that times `execute` and `executemany`. Anything else is
+    passed through to the wrapped cursor."""
+
+    def __init__(self, cursor, conn, profiler: StatementProfiler):
+        self._cursor = cursor
+        self._conn = conn
+        self._profiler = profiler
+        self._running = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _start(self, statement, plan_params, start, many):
+        self._running = (statement, plan_params, start, many)
+
+        # statements returning rows are timed until the caller moves on, so
+        #     fetching is included and the row count is final
+        if not self._cursor.with_rows:
+            self._capture(self._finish())
+
+    def _finish(self):
+        if self._running is None:
+            return None
+
+        statement, plan_params, start, many = self._running
+        self._running = None
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        record = self._profiler.record(
+            statement, elapsed_ms, self._cursor.rowcount, many
+        )
+
+        if self._profiler.wants_plan(record):
+            return (record, statement, plan_params)
+
+        return None
+
+    def _capture(self, pending):
+        # plans are captured on a separate cursor once any result set has
+        #     been read, since an unread result blocks the connection
+        if pending is not None:
+            self._profiler.capture_plan(self._conn, *pending)
+
+    def execute(self, operation, params=(), *args, **kwargs):
+        self._capture(self._finish())
+
+        start = time.perf_counter()
+        result = self._cursor.execute(operation, params, *args, **kwargs)
+        self._start(operation, params, start, False)
+
+        return result
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        self._capture(self._finish())
+
+        # any iterable is accepted, it's read twice to keep a plan parameter
+        seq_params = list(seq_params)
+
+        start = time.perf_counter()
+        result = self._cursor.executemany(
+            operation, seq_params, *args, **kwargs
+        )
+        # the first parameter set is representative enough for the plan
+        plan_params = seq_params[0] if len(seq_params) > 0 else ()
+        self._start(operation, plan_params, start, True)
+
+        return result
+
+    def close(self):
+        pending = self._finish()
+        result = self._cursor.close()
+        self._capture(pending)
+
+        return result
+
+
+class ProfiledConnection:
+    """Connection wrapper handing out `ProfiledCursor`s. Anything else is
+    passed through to the wrapped connection."""
+
+    def __init__(self, conn, profiler: StatementProfiler):
+        self._conn = conn
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return ProfiledCursor(
+            self._conn.cursor(*args, **kwargs), self._conn, self.profiler
+        )
+
+
+def profile_connection(conn: connector.MySQLConnection) -> ProfiledConnection:
+    """Wraps a connection in a profiler configured from the `db_PROFILE_*`
+    environment variables."""
+
+    profiler = StatementProfiler(
+        threshold_ms=float(os.environ.get("db_PROFILE_THRESHOLD_MS", 1000)),
+        sample_rate=float(os.environ.get("db_PROFILE_SAMPLE_RATE", 1.0)),
+        analyze=os.environ.get("db_PROFILE_ANALYZE", "0") == "1",
+        report_dir=os.environ.get("db_PROFILE_REPORT_DIR")
+    )
+
+    return ProfiledConnection(conn, profiler)
+
+
+def write_profile_report(conn):
+    """Writes the profiling report if the connection is being profiled. A
+    report that can't be written is logged rather than failing the run."""
+
+    if not isinstance(conn, ProfiledConnection):
+        return None
+
+    try:
+        return conn.profiler.write_report()
+    except OSError as e:
+        logging.error(f"Unable to write SQL profile report: {e}")
+
+    return None
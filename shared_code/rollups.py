@@ -0,0 +1,249 @@
+import argparse
+import logging
+import math
+from datetime import date
+
+from mysql import connector
+import pandas as pd
+
+create_rollup_sql = """
+CREATE TABLE IF NOT EXISTS weatherrollup (
+  PointID INT NOT NULL,
+  DateValue DATE NOT NULL,
+  MeanValue DOUBLE NULL,
+  MinValue DOUBLE NULL,
+  MaxValue DOUBLE NULL,
+  SumValue DOUBLE NULL,
+  Samples INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (PointID, DateValue)
+)
+"""
+
+select_days_sql = """
+SELECT
+  DateValue
+FROM
+  weatherrollup
+WHERE
+  PointID = %s
+  AND DateValue BETWEEN %s AND %s
+"""
+
+select_rolled_up_sql = """
+SELECT 1 FROM weatherrollup WHERE PointID = %s LIMIT 1
+"""
+
+upsert_rollup_sql = """
+INSERT INTO weatherrollup
+(PointID, DateValue, MeanValue, MinValue, MaxValue, SumValue, Samples)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+  MeanValue=VALUES(MeanValue), MinValue=VALUES(MinValue),
+  MaxValue=VALUES(MaxValue), SumValue=VALUES(SumValue),
+  Samples=VALUES(Samples)
+"""
+
+# only precipitation (point class 10143) is a total, so only it has a sum
+rebuild_rollup_sql = """
+INSERT INTO weatherrollup
+(PointID, DateValue, MeanValue, MinValue, MaxValue, SumValue, Samples)
+SELECT
+  tr.PointID,
+  tr.datevalue,
+  AVG(tr.NumericValue),
+  MIN(tr.NumericValue),
+  MAX(tr.NumericValue),
+  IF(point.PointClassID = 10143, SUM(tr.NumericValue), NULL),
+  COUNT(tr.NumericValue)
+FROM
+  tr
+JOIN
+  point ON point.ID = tr.PointID
+WHERE
+  tr.SiteID = 140
+  AND tr.PointID = %s
+  AND tr.datevalue >= %s
+GROUP BY
+  tr.PointID, tr.datevalue, point.PointClassID
+ON DUPLICATE KEY UPDATE
+  MeanValue=VALUES(MeanValue), MinValue=VALUES(MinValue),
+  MaxValue=VALUES(MaxValue), SumValue=VALUES(SumValue),
+  Samples=VALUES(Samples)
+"""
+
+select_weather_points_sql = """
+SELECT DISTINCT
+  point.ID
+FROM
+  point
+JOIN
+  regressionweatherstations ON (
+    regressionweatherstations.Link = LEFT(point.PointName,4)
+  )
+WHERE
+  point.SiteID = 140
+"""
+
+
+class DailyRollups:
+    """Daily mean, min, max and, for totals, sum of each weather point held in
+    the `weatherrollup` table so consumers can read a row per local date
+    rather than aggregating `tr`.
+
+    :param conn: Database connection holding the rollup table
+    :type conn: connector.MySQLConnection
+    """
+
+    def __init__(self, conn: connector.MySQLConnection):
+        self.conn = conn
+        self.rows = []
+
+        with conn.cursor() as cur:
+            cur.execute(create_rollup_sql)
+
+    def add(self, point_id: int, values: list, total: bool = False):
+        """Rolls up the collected (local datetime, value) pairs of a point.
+        Every day passed in is expected to be complete. The sum is only kept
+        for totals such as precipitation."""
+
+        if len(values) == 0:
+            return
+
+        timestamps, numbers = zip(*values)
+        series = pd.Series(numbers, index=pd.DatetimeIndex(timestamps))
+
+        daily = series.groupby(series.index.date)\
+            .agg(['mean', 'min', 'max', 'sum', 'count'])
+
+        for day, row in daily.iterrows():
+            # days with only missing values have no aggregates
+            if row['count'] == 0:
+                self.rows.append(
+                    (point_id, day, None, None, None, None, 0)
+                )
+                continue
+
+            self.rows.append(
+                (
+                    point_id,
+                    day,
+                    float(row['mean']),
+                    float(row['min']),
+                    float(row['max']),
+                    float(row['sum']) if total else None,
+                    int(row['count'])
+                )
+            )
+
+    def add_daily(self, point_id: int, values: list, total: bool = False):
+        """Stores (local datetime, value, min, max) tuples collected at daily
+        resolution. Min and max are only known where the api provides them,
+        otherwise NaN, and are stored as NULL rather than copied from the
+        value. The sum is only kept for totals such as precipitation."""
+
+        def nullable(x):
+            return None if math.isnan(x) else float(x)
+
+        for timestamp, value, minimum, maximum in values:
+            if math.isnan(value):
+                self.rows.append(
+                    (point_id, timestamp.date(), None, None, None, None, 0)
+                )
+                continue
+
+            self.rows.append(
+                (
+                    point_id,
+                    timestamp.date(),
+                    float(value),
+                    nullable(minimum),
+                    nullable(maximum),
+                    float(value) if total else None,
+                    1
+                )
+            )
+
+    def rolled_up_days(self, point_id: int, start: date, end: date) -> set:
+        """Finds the dates in [start, end] that already have a rollup."""
+
+        with self.conn.cursor() as cur:
+            cur.execute(select_days_sql, (point_id, start, end))
+
+            return {x[0] for x in cur.fetchall()}
+
+    def save(self):
+        """Upserts the rollups added since the last save in the caller's
+        transaction."""
+
+        if len(self.rows) == 0:
+            return
+
+        with self.conn.cursor() as cur:
+            cur.executemany(upsert_rollup_sql, self.rows)
+
+        self.rows = []
+
+    def rebuild(self, point_id: int, since: date = date.min):
+        """Recalculates the rollups of a point from the data in `tr`. Runs in
+        the caller's transaction, committing is left to the caller."""
+
+        logging.info(f"Rebuilding daily rollups for point {point_id}.")
+
+        with self.conn.cursor() as cur:
+            cur.execute(rebuild_rollup_sql, (point_id, since))
+
+    def ensure(self, point_id: int):
+        """Rebuilds the full history of a point that has never been rolled
+        up."""
+
+        with self.conn.cursor() as cur:
+            cur.execute(select_rolled_up_sql, (point_id,))
+
+            rolled_up = cur.fetchone() is not None
+
+        if not rolled_up:
+            self.rebuild(point_id)
+
+
+def rebuild(conn: connector.MySQLConnection, since: date, point_ids=None):
+    """Rebuilds the rollups of the given points, or of every weather station
+    point when none are given."""
+
+    if point_ids is None:
+        with conn.cursor() as cur:
+            cur.execute(select_weather_points_sql)
+
+            point_ids = [x[0] for x in cur.fetchall()]
+
+    rollups = DailyRollups(conn)
+
+    for point_id in point_ids:
+        rollups.rebuild(point_id, since)
+        conn.commit()
+
+
+if __name__ == '__main__':
+    from shared_code.database import getConnection
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description="Rebuild daily weather rollups from the stored trends."
+    )
+    parser.add_argument(
+        '--since',
+        type=date.fromisoformat,
+        default=date.min,
+        help="First date to rebuild (YYYY-MM-DD), defaults to all history."
+    )
+    parser.add_argument(
+        '--point',
+        type=int,
+        action='append',
+        dest='point_ids',
+        help="Point to rebuild, may be repeated. Defaults to every weather "
+             "station point."
+    )
+    args = parser.parse_args()
+
+    rebuild(getConnection(), args.since, args.point_ids)
@@ -0,0 +1,125 @@
+import logging
+
+# supported orderings for `schedule`
+POLICIES = ("recent", "stale", "weight")
+
+
+def allocate(demand: dict, weights: dict, budget: int, priority: list) -> dict:
+    """Splits the budget across stations with weighted max-min fairness.
+    Stations needing less than their share release the rest to the others,
+    and any remainder too small to split goes out one at a time in priority
+    order.
+
+    :param demand: Number of work items for each station
+    :type demand: dict
+    :param weights: Relative share for each station
+    :type weights: dict
+    :param budget: Total number of items that can be run
+    :type budget: int
+    :param priority: Station keys, most important first
+    :type priority: list
+    :return: Number of items allocated to each station
+    :rtype: dict
+    """
+
+    quotas = {x: 0 for x in demand}
+    active = [x for x in priority if demand[x] > 0 and weights[x] > 0]
+
+    while budget > 0 and len(active) > 0:
+        total_weight = sum(weights[x] for x in active)
+
+        granted = 0
+        for station in active:
+            share = int(budget * weights[station] / total_weight)
+            share = min(share, demand[station] - quotas[station])
+            quotas[station] += share
+            granted += share
+
+        # shares rounded down to nothing, hand out single items instead
+        if granted == 0:
+            for station in active[:budget]:
+                quotas[station] += 1
+                granted += 1
+
+        budget -= granted
+        active = [x for x in active if quotas[x] < demand[x]]
+
+    return quotas
+
+
+def schedule(
+    work: dict,
+    budget: int,
+    policy: str = "recent",
+    last_run: dict = None,
+    weights: dict = None
+) -> tuple:
+    """Orders the outstanding work for every station and fits it to the call
+    budget.
+
+    `recent` runs the stations with the newest missing data first, `stale`
+    runs the stations with the oldest `LastRun` first and `weight` shares the
+    budget by the configured station weights. Within a station the newest
+    items are always run first so the latest data arrives ahead of backfill.
+
+    :param work: Sortable work items (dates or date ranges) for each station
+    :type work: dict
+    :param budget: Number of api calls available for the run
+    :type budget: int
+    :param policy: One of `POLICIES`, defaults to "recent"
+    :type policy: str, optional
+    :param last_run: Last run datetime for each station, defaults to None
+    :type last_run: dict, optional
+    :param weights: Relative share for each station, used by the `weight`
+    policy, defaults to None
+    :type weights: dict, optional
+    :raises ValueError: Unknown policy
+    :return: List of (station, items) in run order and the number of items
+    deferred for each station
+    :rtype: tuple
+    """
+
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown schedule policy '{policy}'.")
+
+    last_run = last_run or {}
+    weights = weights or {}
+
+    items = {x: sorted(y, reverse=True) for x, y in work.items()}
+    demand = {x: len(y) for x, y in items.items()}
+
+    if policy == "weight":
+        station_weights = {x: float(weights.get(x, 1)) for x in items}
+    else:
+        station_weights = {x: 1.0 for x in items}
+
+    if policy == "stale":
+        # stations that have never run are the stalest
+        priority = sorted(
+            items,
+            key=lambda x: (last_run.get(x) is not None, last_run.get(x) or 0)
+        )
+    elif policy == "weight":
+        priority = sorted(items, key=lambda x: -station_weights[x])
+    else:
+        priority = sorted(
+            [x for x in items if demand[x] > 0],
+            key=lambda x: items[x][0],
+            reverse=True
+        ) + [x for x in items if demand[x] == 0]
+
+    quotas = allocate(demand, station_weights, budget, priority)
+
+    plan = []
+    deferred = {}
+    for station in priority:
+        plan.append((station, items[station][:quotas[station]]))
+        deferred[station] = demand[station] - quotas[station]
+
+        if deferred[station] > 0:
+            logging.warning(
+                f"Deferred {deferred[station]} of {demand[station]} requests "
+                f"for station {station}."
+            )
+
+    return plan, deferred
@@ -0,0 +1,210 @@
+from contextlib import contextmanager
+import fcntl
+import logging
+import os
+import tempfile
+
+from mysql import connector
+import numpy as np
+import pandas as pd
+
+select_trends_sql = """
+SELECT
+  datevalue,
+  timevalue,
+  NumericValue
+FROM
+  tr
+WHERE
+  SiteID = 140
+  AND PointID = %s
+ORDER BY
+  datevalue, timevalue
+"""
+
+
+# one record per trend so a point's timestamps and values can't drift apart
+trend_dtype = np.dtype([('ts', 'datetime64[s]'), ('v', np.float64)])
+
+
+class WeatherCache:
+    """Local archive of weather point trends for readers that would otherwise
+    range query `tr`. Each point is held in a single flat file of
+    (datetime64[s] local timestamp, float64 value) records sorted by
+    timestamp, memory mapped on read with each column returned as a view.
+
+    Writers hold an exclusive lock per point, so the collector's updates and
+    a consumer building the archive from `tr` can't lose each other's data.
+
+    :param root: Directory the archives are kept in
+    :type root: str
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, point_id: int) -> str:
+        return os.path.join(self.root, f"{point_id}.trends")
+
+    @contextmanager
+    def _lock(self, point_id: int):
+        os.makedirs(self.root, exist_ok=True)
+
+        with open(os.path.join(self.root, f"{point_id}.lock"), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def exists(self, point_id: int) -> bool:
+        return os.path.exists(self._path(point_id))
+
+    def _open(self, point_id: int) -> np.ndarray:
+        path = self._path(point_id)
+
+        # an interrupted append can leave a partial record at the end
+        count = os.path.getsize(path) // trend_dtype.itemsize\
+            if self.exists(point_id) else 0
+
+        if count == 0:
+            return np.empty(0, dtype=trend_dtype)
+
+        return np.memmap(path, dtype=trend_dtype, mode='r', shape=(count,))
+
+    def read_range(self, point_id: int, start, end) -> tuple:
+        """Reads the stored trends for [start, end). The returned arrays are
+        views onto the memory mapped file, no data is copied.
+
+        :param point_id: Weather point to read
+        :type point_id: int
+        :param start: First local datetime to include
+        :param end: Local datetime to stop before
+        :return: Timestamp and value arrays
+        :rtype: tuple
+        """
+
+        trends = self._open(point_id)
+
+        lower, upper = np.searchsorted(
+            trends['ts'],
+            [np.datetime64(start, 's'), np.datetime64(end, 's')]
+        )
+
+        return trends['ts'][lower:upper], trends['v'][lower:upper]
+
+    def _write(self, point_id: int, timestamps, values, append: bool):
+        path = self._path(point_id)
+
+        trends = np.empty(len(timestamps), dtype=trend_dtype)
+        trends['ts'] = timestamps
+        trends['v'] = values
+
+        if append:
+            with open(path, 'ab') as f:
+                f.write(trends.tobytes())
+            return
+
+        # rewrites are swapped in whole so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(trends.tobytes())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def update(self, point_id: int, trends: list):
+        """Adds (local datetime, value) pairs to an existing archive. Data
+        newer than the archive is appended, anything else is merged in with
+        the new values replacing stored ones.
+
+        :param point_id: Weather point to update
+        :type point_id: int
+        :param trends: Collected (local datetime, value) pairs
+        :type trends: list
+        """
+
+        if len(trends) == 0:
+            return
+
+        # an archive being built from `tr` is only published when its lock
+        #     is released, so existence is checked while holding the lock
+        with self._lock(point_id):
+            if self.exists(point_id):
+                self._update(point_id, trends)
+
+    def _update(self, point_id: int, trends: list):
+
+        timestamps = pd.DatetimeIndex([x[0] for x in trends])\
+            .values.astype('datetime64[s]')
+        values = np.array([x[1] for x in trends], dtype=np.float64)
+
+        stored = self._open(point_id)
+        stored_ts, stored_values = stored['ts'], stored['v']
+
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = timestamps[order], values[order]
+
+        if len(stored_ts) == 0 or timestamps[0] > stored_ts[-1]:
+            timestamps, values = _last_unique(timestamps, values)
+            self._write(point_id, timestamps, values, append=True)
+            return
+
+        # backfilled data lands inside the archive so it's rebuilt in order
+        timestamps = np.concatenate([stored_ts, timestamps])
+        values = np.concatenate([stored_values, values])
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = _last_unique(timestamps[order], values[order])
+
+        # drop the map before the file is replaced
+        del stored, stored_ts, stored_values
+
+        self._write(point_id, timestamps, values, append=False)
+
+    def rebuild(self, conn: connector.MySQLConnection, point_id: int):
+        """Recreates the archive of a point from the data in `tr`. The data
+        is read while holding the point's lock so updates committed after the
+        read are merged in once it's published rather than lost."""
+
+        with self._lock(point_id):
+            self._rebuild(conn, point_id)
+
+    def _rebuild(self, conn: connector.MySQLConnection, point_id: int):
+        logging.info(f"Rebuilding weather cache for point {point_id}.")
+
+        with conn.cursor() as cur:
+            cur.execute(select_trends_sql, (point_id,))
+
+            rows = cur.fetchall()
+
+        if len(rows) == 0:
+            timestamps = np.empty(0, dtype='datetime64[s]')
+            values = np.empty(0, dtype=np.float64)
+        else:
+            dates, times, numbers = zip(*rows)
+
+            # time columns are read back as timedeltas from midnight
+            timestamps = np.array(dates, dtype='datetime64[D]')\
+                .astype('datetime64[s]') +\
+                np.array(times, dtype='timedelta64[us]')\
+                .astype('timedelta64[s]')
+            values = np.array(numbers, dtype=np.float64)
+
+        self._write(point_id, timestamps, values, append=False)
+
+    def ensure(self, conn: connector.MySQLConnection, point_id: int):
+        """Builds the archive of a point from `tr` if it isn't cached yet.
+        Once built the collector keeps it up to date."""
+
+        with self._lock(point_id):
+            if not self.exists(point_id):
+                self._rebuild(conn, point_id)
+
+
+def _last_unique(timestamps, values) -> tuple:
+    # keep the last of any repeated timestamps in sorted arrays
+    keep = np.append(timestamps[1:] != timestamps[:-1], True)
+
+    return timestamps[keep], values[keep]
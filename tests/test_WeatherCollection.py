@@ -1,4 +1,6 @@
 import datetime
+import json
+import math
 import os
 import pytest
 from random import uniform
@@ -7,7 +9,12 @@ from statistics import mean
 import pandas as pd
 from pytest_mock import MockerFixture
 
-from WeatherCollection import main, get_missing_dates
+from shared_code.coverage import CoverageIndex
+from shared_code.rollups import DailyRollups
+from shared_code.weathercache import WeatherCache
+from WeatherCollection import (
+    decode_response, get_date_ranges, get_missing_dates, main
+)
 
 
 @pytest.fixture
@@ -83,11 +90,48 @@ def db_fixture(db, module_mocker):
 
 
 def test_get_missing_dates(db):
-    results = get_missing_dates(db, 88242)
+    results = get_missing_dates(db, 88242, CoverageIndex(db))
 
     assert results.size > 0
 
 
+def test_decode_response(vc_response):
+    # Arrange
+    vc_response["days"][0]["hours"][0]["temp"] = None
+    content = json.dumps(vc_response).encode()
+
+    # Act
+    timezone, epochs, values = decode_response(content, ["temp", "dew"])
+
+    # Assert
+    hours = vc_response["days"][0]["hours"]
+    assert timezone == "America/Los_Angeles"
+    assert epochs.tolist() == [x["datetimeEpoch"] for x in hours]
+    assert math.isnan(values["temp"][0])
+    assert values["dew"].tolist() == [x["dew"] for x in hours]
+
+
+def test_decode_response_days(vc_response):
+    content = json.dumps(vc_response).encode()
+
+    _, epochs, values = decode_response(content, ["temp"], "days")
+
+    assert epochs.tolist() == [vc_response["days"][0]["datetimeEpoch"]]
+    assert values["temp"].tolist() == [vc_response["days"][0]["temp"]]
+
+
+def test_get_date_ranges():
+    dates = [datetime.date(2000, 1, x) for x in (1, 2, 3, 4, 6, 7)]
+
+    ranges = get_date_ranges(dates, 3)
+
+    assert ranges == [
+        (datetime.date(2000, 1, 1), datetime.date(2000, 1, 3)),
+        (datetime.date(2000, 1, 4), datetime.date(2000, 1, 4)),
+        (datetime.date(2000, 1, 6), datetime.date(2000, 1, 7))
+    ]
+
+
 def test_WeatherCollection(mocker: MockerFixture, vc_response):
     # Arrange
     missing_dates = pd.DataFrame(
@@ -99,11 +143,9 @@ def test_WeatherCollection(mocker: MockerFixture, vc_response):
         return_value=missing_dates
     )
 
-    mock_json = mocker.Mock()
-    mock_json.return_value = vc_response
-
-    mock_api = mocker.patch('WeatherCollection.r.get')
-    mock_api.return_value.json = mock_json
+    mock_session = mocker.patch('WeatherCollection.r.Session')
+    mock_api = mock_session.return_value.get
+    mock_api.return_value.content = json.dumps(vc_response).encode()
     mock_api.return_value.status_code = 200
 
     mocker.patch.dict(os.environ, {"VC_API_KEY": "test"})
@@ -113,3 +155,129 @@ def test_WeatherCollection(mocker: MockerFixture, vc_response):
 
     # Assert
     assert mock_api.call_count > 0
+
+
+def test_WeatherCollection_days(mocker: MockerFixture, vc_response):
+    # Arrange
+    vc_response["days"][0]["tempmin"] = 1.0
+    vc_response["days"][0]["tempmax"] = 2.0
+
+    missing_dates = pd.DataFrame(
+        [
+            (None, None, datetime.datetime(2000, 1, 1)),
+            (None, None, datetime.datetime(2000, 1, 2))
+        ],
+        columns=['SiteID', 'PointID', 'ts']
+    )
+    mocker.patch(
+        'WeatherCollection.get_missing_dates',
+        return_value=missing_dates
+    )
+    mocker.patch.object(DailyRollups, 'rolled_up_days', return_value=set())
+    add_daily = mocker.spy(DailyRollups, 'add_daily')
+    mark = mocker.spy(CoverageIndex, 'mark')
+    mark_hours = mocker.spy(CoverageIndex, 'mark_hours')
+
+    mock_session = mocker.patch('WeatherCollection.r.Session')
+    mock_api = mock_session.return_value.get
+    mock_api.return_value.content = json.dumps(vc_response).encode()
+    mock_api.return_value.status_code = 200
+
+    mocker.patch.dict(
+        os.environ, {"VC_API_KEY": "test", "WC_RESOLUTION": "days"}
+    )
+
+    # Act
+    main(None)
+
+    # Assert
+    # contiguous days are requested as a single range
+    url = mock_api.call_args_list[0].args[0]
+    assert url.endswith("/2000-01-01/2000-01-02")
+    assert mock_api.call_args_list[0].kwargs['params']['include'] == "days"
+
+    # one row per day returned for each characteristic
+    assert add_daily.call_count >= 12
+    assert all(len(x.args[2]) == 1 for x in add_daily.call_args_list)
+
+    # temperature extremes are stored from the daily elements
+    params = mock_api.call_args_list[0].kwargs['params']
+    assert "tempmin" in params['elements'].split(',')
+    extremes = [x.args[2][0][2:] for x in add_daily.call_args_list]
+    assert (1.0, 2.0) in extremes
+    assert all(math.isnan(x[0]) for x in extremes if x != (1.0, 2.0))
+
+
+def test_WeatherCollection_days_recent(
+    mocker: MockerFixture,
+    vc_response
+):
+    # Arrange
+    yesterday = datetime.datetime.combine(
+        datetime.date.today() - datetime.timedelta(days=1), datetime.time()
+    )
+    missing_dates = pd.DataFrame(
+        [
+            (None, None, datetime.datetime(2000, 1, 1)),
+            (None, None, yesterday)
+        ],
+        columns=['SiteID', 'PointID', 'ts']
+    )
+    mocker.patch(
+        'WeatherCollection.get_missing_dates',
+        return_value=missing_dates
+    )
+    mocker.patch.object(DailyRollups, 'rolled_up_days', return_value=set())
+    mark = mocker.spy(CoverageIndex, 'mark')
+
+    mock_session = mocker.patch('WeatherCollection.r.Session')
+    mock_api = mock_session.return_value.get
+    mock_api.return_value.content = json.dumps(vc_response).encode()
+    mock_api.return_value.status_code = 200
+
+    mocker.patch.dict(
+        os.environ, {"VC_API_KEY": "test", "WC_RESOLUTION": "days"}
+    )
+
+    # Act
+    main(None)
+
+    # Assert
+    # the latest days are still collected hourly and stored as trends
+    includes = {
+        x.args[0].split('/')[-1]: x.kwargs['params']['include']
+        for x in mock_api.call_args_list
+    }
+    assert includes == {
+        "2000-01-01": "days",
+        yesterday.strftime("%Y-%m-%d"): "hours"
+    }
+    assert any(len(x.args[2]) > 0 for x in mark.call_args_list)
+
+
+def test_WeatherCollection_cache_error(mocker: MockerFixture, vc_response):
+    # Arrange
+    missing_dates = pd.DataFrame(
+        [(None, None, datetime.datetime(2000, 1, 1))],
+        columns=['SiteID', 'PointID', 'ts']
+    )
+    mocker.patch(
+        'WeatherCollection.get_missing_dates',
+        return_value=missing_dates
+    )
+    mocker.patch.object(
+        WeatherCache, 'update', side_effect=OSError("read-only")
+    )
+
+    mock_session = mocker.patch('WeatherCollection.r.Session')
+    mock_api = mock_session.return_value.get
+    mock_api.return_value.content = json.dumps(vc_response).encode()
+    mock_api.return_value.status_code = 200
+
+    mocker.patch.dict(
+        os.environ, {"VC_API_KEY": "test", "WEATHER_CACHE_DIR": "cache"}
+    )
+
+    # Act / Assert
+    # a failing cache never fails the collection
+    assert main(None) == "Success."
@@ -0,0 +1,30 @@
+from datetime import date, datetime
+
+from shared_code.coverage import CoverageIndex, FULL_DAY, nonexistent_hours
+
+
+def test_coverage_gaps(db):
+    # Arrange
+    coverage = CoverageIndex(db)
+    coverage.mark_hours(-1, date(2000, 1, 1), FULL_DAY)
+    coverage.mark(
+        -1, [datetime(2000, 1, 2, x) for x in range(24) if x not in (2, 3)]
+    )
+
+    # Act
+    gaps = coverage.gaps(-1, date(2000, 1, 1), date(2000, 1, 4))
+    missing_days = coverage.missing_days(
+        -1, date(2000, 1, 1), date(2000, 1, 4)
+    )
+
+    # Assert
+    assert gaps == [
+        (datetime(2000, 1, 2, 2), datetime(2000, 1, 2, 4)),
+        (datetime(2000, 1, 3), datetime(2000, 1, 4))
+    ]
+    assert missing_days == [date(2000, 1, 2), date(2000, 1, 3)]
+
+
+def test_nonexistent_hours():
+    assert nonexistent_hours(date(2022, 3, 13), "America/New_York") == 1 << 2
+    assert nonexistent_hours(date(2022, 11, 6), "America/New_York") == 0
@@ -0,0 +1,89 @@
+import json
+
+from shared_code.profiling import (
+    ProfiledConnection, StatementProfiler, write_profile_report
+)
+
+
+def test_profiled_select(db, tmp_path):
+    # Arrange
+    profiler = StatementProfiler(threshold_ms=0, report_dir=str(tmp_path))
+    conn = ProfiledConnection(db, profiler)
+
+    # Act
+    with conn.cursor() as cur:
+        cur.execute("SELECT ID FROM point WHERE SiteID = %s", (140,))
+        rows = cur.fetchall()
+
+    report = profiler.write_report()
+
+    # Assert
+    assert len(profiler.records) == 1
+    assert profiler.records[0]["rowcount"] == len(rows)
+    assert profiler.records[0]["slow"]
+    assert "plan" in profiler.records[0]
+
+    with open(report) as f:
+        assert len(json.load(f)["statements"]) == 1
+
+
+def test_profiled_select_analyze(db, tmp_path):
+    # Arrange
+    profiler = StatementProfiler(
+        threshold_ms=0, analyze=True, report_dir=str(tmp_path)
+    )
+    conn = ProfiledConnection(db, profiler)
+
+    # Act
+    with conn.cursor() as cur:
+        cur.execute("SELECT ID FROM point WHERE SiteID = %s", (140,))
+        cur.fetchall()
+
+    # Assert
+    assert "plan_error" not in profiler.records[0]
+    assert "plan" in profiler.records[0]
+
+
+def test_explain_sql():
+    profiler = StatementProfiler(analyze=True)
+
+    assert profiler.explain_sql("DROP TEMPORARY TABLE degreedays") is None
+    assert profiler.explain_sql(
+        "CREATE TEMPORARY TABLE degreedays SELECT 1"
+    ) == "EXPLAIN SELECT 1"
+    assert profiler.explain_sql("SELECT 1") == "EXPLAIN ANALYZE SELECT 1"
+    assert profiler.explain_sql("SELECT 1", mariadb=True) == "ANALYZE SELECT 1"
+    assert profiler.explain_sql(
+        "INSERT INTO tr (SELECT * FROM degreedays)"
+    ).startswith("EXPLAIN INSERT")
+
+
+def test_write_profile_report_failure(db, tmp_path):
+    # a file where the report directory should be makes the write fail
+    blocked = tmp_path / "blocked"
+    blocked.write_text("")
+    profiler = StatementProfiler(report_dir=str(blocked))
+
+    assert write_profile_report(ProfiledConnection(db, profiler)) is None
+
+
+def test_profiled_executemany_generator(db, tmp_path):
+    # Arrange
+    profiler = StatementProfiler(threshold_ms=0, report_dir=str(tmp_path))
+    conn = ProfiledConnection(db, profiler)
+
+    # Act
+    with conn.cursor() as cur:
+        cur.execute("CREATE TEMPORARY TABLE profiled (ID INT)")
+        cur.executemany(
+            "INSERT INTO profiled (ID) VALUES (%s)",
+            ((x,) for x in range(3))
+        )
+        cur.execute("SELECT COUNT(*) FROM profiled")
+        count = cur.fetchone()[0]
+        cur.execute("DROP TEMPORARY TABLE profiled")
+
+    # Assert
+    assert count == 3
+    assert profiler.records[1]["executemany"]
+    assert "plan_error" not in profiler.records[1]
@@ -0,0 +1,47 @@
+from datetime import date, datetime
+import math
+
+from shared_code.rollups import DailyRollups
+
+
+def test_rollups_add(db):
+    # Arrange
+    rollups = DailyRollups(db)
+    values = [(datetime(2000, 1, 1, x), float(x)) for x in range(24)]
+    values.append((datetime(2000, 1, 2), math.nan))
+
+    # Act
+    rollups.add(-1, values)
+
+    # Assert
+    assert rollups.rows == [
+        (-1, date(2000, 1, 1), 11.5, 0.0, 23.0, None, 24),
+        (-1, date(2000, 1, 2), None, None, None, None, 0)
+    ]
+
+
+def test_rollups_add_total(db):
+    rollups = DailyRollups(db)
+    values = [(datetime(2000, 1, 1, x), 0.5) for x in range(24)]
+
+    rollups.add(-1, values, total=True)
+
+    assert rollups.rows == [(-1, date(2000, 1, 1), 0.5, 0.5, 0.5, 12.0, 24)]
+
+
+def test_rollups_add_daily(db):
+    rollups = DailyRollups(db)
+
+    rollups.add_daily(
+        -1,
+        [
+            (datetime(2000, 1, 1), 5.0, 1.0, 9.0),
+            (datetime(2000, 1, 2), 6.0, math.nan, math.nan)
+        ]
+    )
+
+    # extremes aren't made up when the api doesn't provide them
+    assert rollups.rows == [
+        (-1, date(2000, 1, 1), 5.0, 1.0, 9.0, None, 1),
+        (-1, date(2000, 1, 2), 6.0, None, None, None, 1)
+    ]
@@ -0,0 +1,49 @@
+from datetime import date, datetime
+
+import pytest
+
+from shared_code.scheduler import allocate, schedule
+
+
+def test_allocate_fair_share():
+    quotas = allocate(
+        {1: 500, 2: 3, 3: 500}, {1: 1, 2: 1, 3: 1}, 100, [1, 2, 3]
+    )
+
+    # the small station gets everything it needs, the rest is split evenly
+    assert quotas == {1: 49, 2: 3, 3: 48}
+
+
+def test_schedule_recent():
+    # Arrange
+    work = {
+        1: [date(2000, 1, x) for x in range(1, 31)],
+        2: [date(2000, 2, 1)]
+    }
+
+    # Act
+    plan, deferred = schedule(work, 5)
+
+    # Assert
+    assert plan == [
+        (2, [date(2000, 2, 1)]),
+        (1, [date(2000, 1, x) for x in range(30, 26, -1)])
+    ]
+    assert deferred == {1: 26, 2: 0}
+
+
+def test_schedule_stale_and_weight():
+    work = {1: [date(2000, 1, 1)] * 10, 2: [date(2000, 1, 1)] * 10}
+
+    plan, _ = schedule(
+        work, 1, "stale", last_run={1: datetime(2000, 1, 2), 2: None}
+    )
+    assert [(x, len(y)) for x, y in plan] == [(2, 1), (1, 0)]
+
+    plan, _ = schedule(work, 8, "weight", weights={1: 3})
+    assert [(x, len(y)) for x, y in plan] == [(1, 6), (2, 2)]
+
+
+def test_schedule_unknown_policy():
+    with pytest.raises(ValueError):
+        schedule({}, 1, "random")
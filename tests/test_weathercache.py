@@ -0,0 +1,114 @@
+from datetime import date, datetime, timedelta
+import os
+import threading
+
+import numpy as np
+
+from shared_code import weathercache
+from shared_code.weathercache import WeatherCache
+
+
+def test_weathercache_update(tmp_path):
+    # Arrange
+    cache = WeatherCache(str(tmp_path))
+    cache._write(
+        -1,
+        np.array(['2000-01-02T00:00:00'], dtype='datetime64[s]'),
+        np.array([2.0]),
+        append=False
+    )
+
+    # Act
+    cache.update(-1, [(datetime(2000, 1, 3), 3.0)])
+    cache.update(
+        -1, [(datetime(2000, 1, 1), 1.0), (datetime(2000, 1, 2), 4.0)]
+    )
+    timestamps, values = cache.read_range(
+        -1, datetime(2000, 1, 2), datetime(2000, 1, 4)
+    )
+
+    # Assert
+    assert timestamps.tolist() == [datetime(2000, 1, 2), datetime(2000, 1, 3)]
+    assert values.tolist() == [4.0, 3.0]
+    assert isinstance(values.base, np.memmap)
+
+
+def test_weathercache_read_during_rewrite(tmp_path, mocker):
+    # Arrange
+    cache = WeatherCache(str(tmp_path))
+    cache._write(
+        -1,
+        np.array(['2000-01-02T00:00:00'], dtype='datetime64[s]'),
+        np.array([2.0]),
+        append=False
+    )
+    reads = []
+    os_replace = os.replace
+
+    # read the archive after the new data is written but before it's swapped
+    #     in
+    def replace(src, dst):
+        reads.append(
+            cache.read_range(-1, datetime(2000, 1, 1), datetime(2000, 1, 3))
+        )
+        os_replace(src, dst)
+
+    mocker.patch.object(weathercache.os, 'replace', side_effect=replace)
+
+    # Act
+    cache.update(-1, [(datetime(2000, 1, 1), 1.0)])
+
+    # Assert
+    timestamps, values = reads[0]
+    assert timestamps.tolist() == [datetime(2000, 1, 2)]
+    assert values.tolist() == [2.0]
+
+    timestamps, values = cache.read_range(
+        -1, datetime(2000, 1, 1), datetime(2000, 1, 3)
+    )
+    assert timestamps.tolist() == [datetime(2000, 1, 1), datetime(2000, 1, 2)]
+    assert values.tolist() == [1.0, 2.0]
+
+
+def test_weathercache_missing_point(tmp_path):
+    cache = WeatherCache(str(tmp_path))
+
+    cache.update(-2, [(datetime(2000, 1, 1), 1.0)])
+    timestamps, values = cache.read_range(
+        -2, datetime(2000, 1, 1), datetime(2000, 1, 2)
+    )
+
+    assert len(timestamps) == 0 and len(values) == 0
+
+
+def test_weathercache_update_waits_for_rebuild(tmp_path, mocker):
+    # Arrange
+    cache = WeatherCache(str(tmp_path))
+    conn = mocker.MagicMock()
+    cur = conn.cursor.return_value.__enter__.return_value
+
+    # the collector commits and updates while the consumer is reading `tr`
+    #     for a stale snapshot
+    def fetchall():
+        thread = threading.Thread(
+            target=cache.update, args=(-1, [(datetime(2000, 1, 2), 2.0)])
+        )
+        thread.start()
+        thread.join(0.5)
+        threads.append(thread)
+
+        return [(date(2000, 1, 1), timedelta(), 1.0)]
+
+    threads = []
+    cur.fetchall.side_effect = fetchall
+
+    # Act
+    cache.ensure(conn, -1)
+    threads[0].join()
+
+    # Assert
+    timestamps, values = cache.read_range(
+        -1, datetime(2000, 1, 1), datetime(2000, 1, 3)
+    )
+    assert timestamps.tolist() == [datetime(2000, 1, 1), datetime(2000, 1, 2)]
+    assert values.tolist() == [1.0, 2.0]